@@ -6,29 +6,26 @@ Supports both local development and cloud hosting
 """
 
 import os
+import re
+import gc
+import sys
 import json
-import torch
+import gzip
+import time
+import hashlib
 import logging
-import requests
+import threading
+import functools
 from datetime import datetime
 from typing import Dict, Optional, List
-from flask import Flask, request, jsonify, render_template_string
-from flask_cors import CORS
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from pathlib import Path
 import uuid
 
-# ================================================================================
-# LOGGING CONFIGURATION
-# ================================================================================
+# torch and transformers are imported lazily, only once a model is needed,
+# so health-only processes and handler tests start without paying for them.
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('chatbot.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -63,43 +60,92 @@ class Config:
     MIN_QUERY_LENGTH = 10
     TIMEOUT = 60
     
+    # Memory pressure (percent of system memory in use, or RSS limit in MB)
+    MEMORY_CHECK_INTERVAL = 2.0
+    MEMORY_REDUCE_AT = 75.0
+    MEMORY_SHED_AT = 85.0
+    MEMORY_CRITICAL_AT = 92.0
+    MEMORY_RSS_LIMIT_MB = None
+    MEMORY_CLEAR_INTERVAL = 60.0
+    MAX_INPUT_LENGTH = 2048
+    
+    # Pre-filter
+    ENABLE_PREFILTER = True
+    SUPPORTED_CROPS = {
+        "apple", "grape", "rice", "tomato", "potato", "corn", "maize", "wheat",
+        "pepper", "cherry", "peach", "strawberry", "orange", "soybean", "cotton"
+    }
+    
+    # HTTP responses
+    COMPRESS_MIN_BYTES = 1024
+    DASHBOARD_MAX_AGE = 300
+    
+    # Logging
+    LOG_FILE = "chatbot.log"
+    LOG_LEVEL = logging.INFO
+    
     # Features
     ENABLE_HISTORY = True
     ENABLE_AUTHENTICATION = False
     API_KEYS = {}
 
 
+# ================================================================================
+# LOGGING CONFIGURATION
+# ================================================================================
+
+def configure_logging(config=Config):
+    """Configure root logging unless a host (gunicorn, pytest) already did"""
+    root = logging.getLogger()
+    if root.handlers or getattr(root, "_chatbot_configured", False):
+        return
+    handlers = [logging.StreamHandler()]
+    if config.LOG_FILE:
+        handlers.append(logging.FileHandler(config.LOG_FILE, delay=True))
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=handlers
+    )
+    root._chatbot_configured = True
+
+
 # ================================================================================
 # REQUEST/RESPONSE MODELS
 # ================================================================================
 
 class DiagnosisRequest:
     """Structured diagnosis request"""
-    def __init__(self, query: str, session_id: Optional[str] = None):
+    def __init__(self, query: str, session_id: Optional[str] = None,
+                 priority: str = "normal"):
         self.query = query.strip()
         self.session_id = session_id or str(uuid.uuid4())
+        self.priority = priority if priority in ("low", "normal", "high") else "normal"
         self.timestamp = datetime.now()
     
-    def is_valid(self) -> tuple[bool, str]:
+    def is_valid(self, min_length: int = Config.MIN_QUERY_LENGTH,
+                 max_length: int = Config.MAX_QUERY_LENGTH) -> tuple[bool, str]:
         """Validate request"""
         if not self.query:
             return False, "Query cannot be empty"
-        if len(self.query) < Config.MIN_QUERY_LENGTH:
-            return False, f"Query too short (min {Config.MIN_QUERY_LENGTH} chars)"
-        if len(self.query) > Config.MAX_QUERY_LENGTH:
-            return False, f"Query too long (max {Config.MAX_QUERY_LENGTH} chars)"
+        if len(self.query) < min_length:
+            return False, f"Query too short (min {min_length} chars)"
+        if len(self.query) > max_length:
+            return False, f"Query too long (max {max_length} chars)"
         return True, ""
 
 
 class DiagnosisResponse:
     """Structured diagnosis response"""
     def __init__(self, success: bool, query: str, response: Optional[str] = None, 
-                 error: Optional[str] = None, session_id: Optional[str] = None):
+                 error: Optional[str] = None, session_id: Optional[str] = None,
+                 intent: str = "diagnosis"):
         self.success = success
         self.query = query
         self.response = response
         self.error = error
         self.session_id = session_id
+        self.intent = intent
         self.timestamp = datetime.now().isoformat()
         self.request_id = str(uuid.uuid4())
     
@@ -111,11 +157,167 @@ class DiagnosisResponse:
             "response": self.response,
             "error": self.error,
             "session_id": self.session_id,
+            "intent": self.intent,
             "request_id": self.request_id,
             "timestamp": self.timestamp
         }
 
 
+# ================================================================================
+# QUERY PRE-FILTER
+# ================================================================================
+
+class QueryPreFilter:
+    """
+    Keyword-based intent classifier that runs before the model
+    
+    Greetings, help requests, unsupported crops, spam and sentences with no
+    crop, pest or symptom vocabulary get a canned answer. Anything mentioning
+    farming (or too short to judge) is treated as a diagnosis question and
+    sent to the LLM.
+    """
+    WORD_RE = re.compile(r"[a-z]+")
+    URL_RE = re.compile(r"https?://\S+|\bwww\.\S+")
+    
+    GREETINGS = {
+        "hi", "hello", "hey", "hiya", "greetings", "thanks", "thank", "thx",
+        "bye", "goodbye", "morning", "afternoon", "evening", "ok", "okay", "cool"
+    }
+    HELP_PHRASES = ("what can you do", "how do i use", "how to use", "example", "who are you")
+    SPAM_TERMS = {
+        "buy", "cheap", "sale", "discount", "offer", "free", "casino", "bet", "lottery",
+        "bitcoin", "crypto", "loan", "viagra", "subscribe", "click", "watches", "replica"
+    }
+    SHORT_INTENTS = ("greeting", "help")
+    OFF_TOPIC_MIN_WORDS = 3
+    # Crop, pest, symptom and treatment vocabulary (matched on words and singular stems)
+    AGRI_TERMS = {
+        # plants and growing
+        "crop", "plant", "tree", "leaf", "leaves", "stem", "stalk", "root", "fruit",
+        "seed", "seedling", "sprout", "bud", "shoot", "flower", "blossom", "vine",
+        "twig", "bark", "branch", "trunk", "pod", "grain", "ear", "tuber", "soil",
+        "field", "farm", "orchard", "greenhouse", "nursery", "garden", "harvest",
+        "yield", "irrigation", "watering", "germinate", "germination", "grow",
+        "growing", "growth", "weed", "compost", "manure", "mulch", "acidic", "ph",
+        "nitrogen", "nutrient", "deficiency",
+        # pests
+        "pest", "insect", "bug", "aphid", "mite", "worm", "larva", "larvae", "beetle",
+        "whitefly", "thrip", "thrips", "nematode", "caterpillar", "borer", "weevil",
+        "moth", "mealybug", "leafhopper", "hopper", "locust", "grub", "slug", "snail",
+        "scale", "spider", "webbing",
+        # diseases and symptoms
+        "disease", "fungus", "fungi", "fungal", "bacteria", "bacterial", "virus",
+        "viral", "pathogen", "infection", "infected", "mold", "mould", "mildew",
+        "powdery", "downy", "blight", "rust", "rot", "rotting", "scab", "smut",
+        "anthracnose", "fusarium", "verticillium", "phytophthora", "mosaic", "canker",
+        "gall", "sooty", "coating", "spot", "speck", "blotch", "streak", "lesion",
+        "patch", "wilt", "wilting", "wilted", "droop", "drooping", "curl", "curling",
+        "yellow", "yellowing", "brown", "browning", "black", "white", "gray", "grey",
+        "fuzz", "fuzzy", "pale", "stunted", "dying", "dead", "dried", "sticky",
+        "hole", "chewed", "symptom",
+        # treatment
+        "treat", "treatment", "cure", "control", "spray", "fungicide", "pesticide",
+        "insecticide", "herbicide", "fertilizer", "neem", "sulfur", "copper", "chemical"
+    }
+    # Crops the model was not trained on. Words that double as colours or farm
+    # inputs (lime, olive, lemon, plum, tea, ...) are deliberately left out.
+    OTHER_CROPS = {
+        "banana", "mango", "coffee", "cocoa", "cacao", "sugarcane", "cassava",
+        "onion", "garlic", "cabbage", "carrot", "lettuce", "cucumber", "melon",
+        "watermelon", "pineapple", "papaya", "coconut", "barley", "oat", "sorghum",
+        "millet", "pear", "tobacco", "peanut", "groundnut", "chickpea", "lentil"
+    }
+    
+    CANNED = {
+        "greeting": "Hello! Describe the symptoms you see on your crop "
+                    "(e.g. 'brown spots on tomato leaves') and I'll help diagnose it.",
+        "help": "I diagnose crop diseases and pests. Try: 'My apple tree has velvety "
+                "olive-green spots' or 'Rice plants showing yellow patches - what disease?'",
+        "unsupported_crop": "Sorry, I can't diagnose {crops} yet. Supported crops: {supported}.",
+        "off_topic": "I can only help with crop diseases and pests. Please describe "
+                     "the symptoms on your plants."
+    }
+
+    def __init__(self, metrics: Optional["ServiceMetrics"] = None, config=Config):
+        self.metrics = metrics
+        self.config = config
+
+    @staticmethod
+    def _singular(word: str) -> str:
+        """Crude plural stripping for crop names"""
+        if word.endswith(("oes", "ches", "shes", "xes")):
+            return word[:-2]
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if word.endswith("s") and not word.endswith("ss"):
+            return word[:-1]
+        return word
+
+    def classify(self, query: str) -> tuple[str, Optional[str]]:
+        """
+        Classify a query (no side effects; see record())
+        
+        Returns:
+            (intent, canned_response); canned_response is None for "diagnosis"
+        """
+        text = query.lower()
+        words = self.WORD_RE.findall(text)
+        stems = {self._singular(w) for w in words}
+        
+        crops = stems & self.config.SUPPORTED_CROPS
+        other_crops = stems & self.OTHER_CROPS
+        has_agri_term = bool((set(words) | stems) & self.AGRI_TERMS)
+        
+        # Links and spam words only count when there is no farming context
+        # (e.g. a photo link next to "tomato leaf spots" still reaches the model)
+        if not words:
+            intent = "off_topic"
+        elif crops or has_agri_term:
+            intent = "diagnosis"
+        elif other_crops:
+            intent = "unsupported_crop"
+        elif self.URL_RE.search(text) or any(w in self.SPAM_TERMS for w in words):
+            intent = "off_topic"
+        elif "help" in words or any(phrase in text for phrase in self.HELP_PHRASES):
+            intent = "help"
+        elif len(words) <= 6 and any(w in self.GREETINGS for w in words):
+            intent = "greeting"
+        elif len(words) >= self.OFF_TOPIC_MIN_WORDS:
+            # A full sentence without a single crop, pest or symptom word
+            intent = "off_topic"
+        else:
+            intent = "diagnosis"
+        
+        if intent == "diagnosis":
+            return intent, None
+        if intent == "unsupported_crop":
+            return intent, self.CANNED[intent].format(
+                crops=", ".join(sorted(other_crops)),
+                supported=", ".join(sorted(self.config.SUPPORTED_CROPS))
+            )
+        return intent, self.CANNED[intent]
+
+    def record(self, intent: str):
+        """Count a request that was answered canned or sent to the model"""
+        if self.metrics:
+            self.metrics.increment("prefilter.total")
+            self.metrics.increment(f"prefilter.intent.{intent}")
+            if intent != "diagnosis":
+                self.metrics.increment("prefilter.diverted")
+
+    def get_status(self) -> Dict:
+        """Get pre-filter statistics"""
+        counters = self.metrics.snapshot()["counters"] if self.metrics else {}
+        total = counters.get("prefilter.total", 0)
+        diverted = counters.get("prefilter.diverted", 0)
+        return {
+            "enabled": self.config.ENABLE_PREFILTER,
+            "total": total,
+            "diverted": diverted,
+            "diverted_fraction": round(diverted / total, 4) if total else 0.0
+        }
+
+
 # ================================================================================
 # MODEL MANAGEMENT
 # ================================================================================
@@ -123,8 +325,11 @@ class DiagnosisResponse:
 class CropDiseaseModel:
     """Manage fine-tuned Llama model"""
 
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, memory_monitor: Optional["MemoryMonitor"] = None,
+                 config=Config):
         self.model_path = model_path
+        self.memory_monitor = memory_monitor
+        self.config = config
         self.model = None
         self.tokenizer = None
         self.device = self._get_device()
@@ -133,6 +338,8 @@ class CropDiseaseModel:
 
     def _get_device(self) -> str:
         """Detect available device"""
+        import torch
+        
         if torch.cuda.is_available():
             device = "cuda"
             logger.info(f"CUDA available. GPU: {torch.cuda.get_device_name(0)}")
@@ -144,6 +351,7 @@ class CropDiseaseModel:
     def load_model(self) -> bool:
         """Load model and tokenizer"""
         try:
+            import torch
             from transformers import AutoModelForCausalLM, AutoTokenizer
             
             if not os.path.exists(self.model_path):
@@ -199,7 +407,14 @@ class CropDiseaseModel:
                 "response": None
             }
         
-        max_tokens = max_tokens or Config.MAX_TOKENS
+        import torch
+        
+        max_tokens = max_tokens or self.config.MAX_TOKENS
+        max_length = self.config.MAX_INPUT_LENGTH
+        if self.memory_monitor:
+            self.memory_monitor.check()
+            max_tokens = self.memory_monitor.token_budget(max_tokens)
+            max_length = self.memory_monitor.input_budget(max_length)
 
         try:
             prompt = f"""Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.
@@ -216,7 +431,7 @@ class CropDiseaseModel:
             inputs = self.tokenizer(
                 prompt, 
                 return_tensors="pt",
-                max_length=2048,
+                max_length=max_length,
                 truncation=True,
                 padding=True
             ).to(self.device)
@@ -225,9 +440,9 @@ class CropDiseaseModel:
                 outputs = self.model.generate(
                     **inputs,
                     max_new_tokens=max_tokens,
-                    temperature=Config.TEMPERATURE,
-                    top_p=Config.TOP_P,
-                    repetition_penalty=Config.REPETITION_PENALTY,
+                    temperature=self.config.TEMPERATURE,
+                    top_p=self.config.TOP_P,
+                    repetition_penalty=self.config.REPETITION_PENALTY,
                     do_sample=True,
                     pad_token_id=self.tokenizer.eos_token_id,
                 )
@@ -254,8 +469,10 @@ class CropDiseaseModel:
                 "error": None
             }
             
-        except torch.cuda.OutOfMemoryError:
-            logger.error("GPU out of memory")
+        except (torch.cuda.OutOfMemoryError, MemoryError):
+            logger.error(f"Out of memory on {self.device}")
+            if self.memory_monitor:
+                self.memory_monitor.record_oom()
             return {
                 "success": False,
                 "error": "Model memory exceeded. Try with shorter query.",
@@ -271,6 +488,8 @@ class CropDiseaseModel:
 
     def get_status(self) -> Dict:
         """Get model status"""
+        import torch
+        
         return {
             "loaded": self.is_loaded,
             "device": self.device,
@@ -315,25 +534,281 @@ class ConversationHistory:
             del self.history[session_id]
 
 
+# ================================================================================
+# METRICS
+# ================================================================================
+
+class ServiceMetrics:
+    """Thread-safe in-process counters and recent events"""
+    
+    def __init__(self, max_events: int = 50):
+        self.counters: Dict[str, int] = {}
+        self.events: List[Dict] = []
+        self.max_events = max_events
+        self._lock = threading.Lock()
+    
+    def increment(self, name: str, amount: int = 1):
+        """Increment a named counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def record_event(self, name: str, **fields):
+        """Record a timestamped event, keeping only the most recent ones"""
+        with self._lock:
+            self.events.append({"event": name, "timestamp": datetime.now().isoformat(), **fields})
+            if len(self.events) > self.max_events:
+                self.events = self.events[-self.max_events:]
+    
+    def snapshot(self) -> Dict:
+        """Get a copy of all counters and events"""
+        with self._lock:
+            return {"counters": dict(self.counters), "events": list(self.events)}
+
+
+# ================================================================================
+# MEMORY MANAGEMENT
+# ================================================================================
+
+@functools.lru_cache(maxsize=None)
+def _load_libc():
+    """Load glibc for malloc_trim, or None on other platforms"""
+    try:
+        import ctypes
+        libc = ctypes.CDLL("libc.so.6")
+        return libc if hasattr(libc, "malloc_trim") else None
+    except OSError:
+        return None
+
+
+def _malloc_trim():
+    """Return freed heap memory to the OS (glibc only)"""
+    libc = _load_libc()
+    if libc is not None:
+        libc.malloc_trim(0)
+
+
+class MemoryMonitor:
+    """
+    Track process RSS and system available memory and degrade gradually
+    
+    Levels:
+        normal:   no restrictions
+        reduced:  shrink max_new_tokens and prompt length
+        shedding: additionally reject low-priority requests
+        critical: additionally reject normal-priority requests and release
+                  freed memory (gc, malloc_trim, CUDA cache, registered caches)
+                  on entering the level, then at most every MEMORY_CLEAR_INTERVAL
+    """
+    LEVELS = ["normal", "reduced", "shedding", "critical"]
+    TOKEN_SCALE = {"normal": 1.0, "reduced": 0.5, "shedding": 0.5, "critical": 0.25}
+    INPUT_SCALE = {"normal": 1.0, "reduced": 0.5, "shedding": 0.5, "critical": 0.25}
+
+    def __init__(self, metrics: Optional[ServiceMetrics] = None, config=Config):
+        self.metrics = metrics
+        self.config = config
+        self.level = "normal"
+        self.last_sample: Dict = {}
+        self._last_check = 0.0
+        self._last_clear = 0.0
+        self._cache_clearers = []
+        self._lock = threading.Lock()
+
+    def register_cache(self, clear_fn):
+        """Register a callable that frees a cache (never user data) at the critical level"""
+        self._cache_clearers.append(clear_fn)
+
+    def sample(self) -> Dict:
+        """Read process RSS and system memory (psutil if available, else /proc)"""
+        try:
+            import psutil
+            vm = psutil.virtual_memory()
+            return {
+                "rss_mb": psutil.Process().memory_info().rss / 1e6,
+                "available_mb": vm.available / 1e6,
+                "used_percent": vm.percent
+            }
+        except ImportError:
+            pass
+        
+        try:
+            with open("/proc/self/statm") as f:
+                rss_pages = int(f.read().split()[1])
+            meminfo = {}
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    key, value = line.split(":", 1)
+                    meminfo[key] = int(value.split()[0])  # kB
+            total = meminfo["MemTotal"]
+            available = meminfo.get("MemAvailable", meminfo.get("MemFree", total))
+            return {
+                "rss_mb": rss_pages * os.sysconf("SC_PAGE_SIZE") / 1e6,
+                "available_mb": available / 1e3,
+                "used_percent": 100.0 * (total - available) / total
+            }
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _level_for(self, sample: Dict) -> str:
+        """Map a memory sample to a degradation level"""
+        pressure = sample.get("used_percent", 0.0)
+        if self.config.MEMORY_RSS_LIMIT_MB:
+            rss_percent = 100.0 * sample.get("rss_mb", 0.0) / self.config.MEMORY_RSS_LIMIT_MB
+            pressure = max(pressure, rss_percent)
+        
+        if pressure >= self.config.MEMORY_CRITICAL_AT:
+            return "critical"
+        if pressure >= self.config.MEMORY_SHED_AT:
+            return "shedding"
+        if pressure >= self.config.MEMORY_REDUCE_AT:
+            return "reduced"
+        return "normal"
+
+    def check(self, force: bool = False) -> str:
+        """Sample memory (rate limited) and apply level transitions"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_check < self.config.MEMORY_CHECK_INTERVAL:
+                return self.level
+            self._last_check = now
+            
+            self.last_sample = self.sample()
+            new_level = self._level_for(self.last_sample)
+            if new_level != self.level:
+                self._transition(new_level)
+            elif new_level == "critical" and now - self._last_clear >= self.config.MEMORY_CLEAR_INTERVAL:
+                self.clear_caches()
+            return self.level
+
+    def _transition(self, new_level: str):
+        """Record a level change"""
+        old_level = self.level
+        self.level = new_level
+        log = logger.warning if self.LEVELS.index(new_level) > self.LEVELS.index(old_level) else logger.info
+        log(f"Memory pressure: {old_level} -> {new_level} ({self.last_sample})")
+        if self.metrics:
+            self.metrics.increment(f"memory.transition.{new_level}")
+            self.metrics.record_event("memory_transition", from_level=old_level,
+                                      to_level=new_level, **self.last_sample)
+        if new_level == "critical":
+            self.clear_caches()
+
+    def clear_caches(self):
+        """Free cached memory and return freed heap pages to the OS"""
+        self._last_clear = time.monotonic()
+        for clear_fn in self._cache_clearers:
+            try:
+                clear_fn()
+            except Exception as e:
+                logger.error(f"Cache clear failed: {str(e)}")
+        gc.collect()
+        _malloc_trim()
+        torch = sys.modules.get("torch")  # never import torch just to clear it
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if self.metrics:
+            self.metrics.increment("memory.cache_clears")
+
+    def record_oom(self):
+        """Handle an out-of-memory error raised during generation"""
+        if self.metrics:
+            self.metrics.increment("memory.oom")
+        with self._lock:
+            if self.level != "critical":
+                self._transition("critical")
+            else:
+                self.clear_caches()
+            self._last_check = time.monotonic()
+
+    def token_budget(self, max_tokens: int) -> int:
+        """Scale max_new_tokens for the current level"""
+        return max(16, int(max_tokens * self.TOKEN_SCALE[self.level]))
+
+    def input_budget(self, max_length: int) -> int:
+        """Scale prompt truncation length for the current level"""
+        return max(128, int(max_length * self.INPUT_SCALE[self.level]))
+
+    def should_shed(self, priority: str = "normal") -> bool:
+        """Whether a request of this priority should be rejected (high is never shed)"""
+        level = self.LEVELS.index(self.level)
+        shed = ((priority == "low" and level >= self.LEVELS.index("shedding"))
+                or (priority == "normal" and self.level == "critical"))
+        if shed:
+            if self.metrics:
+                self.metrics.increment("memory.shed")
+            return True
+        return False
+
+    def get_status(self) -> Dict:
+        """Get memory status"""
+        return {"level": self.level, **self.last_sample}
+
+
 # ================================================================================
 # FLASK APP
 # ================================================================================
 
-app = Flask(__name__)
-app.config.from_object(Config)
-CORS(app)
+api = Blueprint("api", __name__)
 
 # Global instances
-disease_model = None
-conversation_history = ConversationHistory()
 ngrok_url = None
 
 
-def init_model():
-    """Initialize model"""
-    global disease_model
-    disease_model = CropDiseaseModel(Config.MODEL_PATH)
-    return disease_model.load_model()
+class ChatbotServices:
+    """Shared state for one app: history, metrics, memory monitor, pre-filter and model"""
+    
+    def __init__(self, config=Config):
+        self.config = config
+        self.conversation_history = ConversationHistory()
+        self.metrics = ServiceMetrics()
+        self.memory_monitor = MemoryMonitor(self.metrics, config)
+        self.prefilter = QueryPreFilter(self.metrics, config)
+        self.disease_model = None
+    
+    def init_model(self) -> bool:
+        """Initialize model"""
+        self.disease_model = CropDiseaseModel(self.config.MODEL_PATH,
+                                              memory_monitor=self.memory_monitor,
+                                              config=self.config)
+        return self.disease_model.load_model()
+
+
+def get_services() -> ChatbotServices:
+    """Services of the current app"""
+    return current_app.extensions["chatbot"]
+
+
+def create_app(config=Config, services: Optional[ChatbotServices] = None) -> Flask:
+    """Application factory: configure logging, build services and the Flask app"""
+    from flask_cors import CORS
+    
+    configure_logging(config)
+    app = Flask(__name__)
+    app.extensions["chatbot"] = services or ChatbotServices(config)
+    app.json = FastJSONProvider(app)
+    app.config.from_object(config)
+    CORS(app)
+    app.register_blueprint(api)
+    app.after_request(compress_response)
+    app.extensions["dashboard"] = StaticAsset(DASHBOARD_HTML, "text/html", config.DASHBOARD_MAX_AGE)
+    
+    try:
+        from flask_sock import Sock
+        Sock(app).route("/ws/chat")(chat_socket)
+        app.config["WEBSOCKET_ENABLED"] = True
+    except ImportError:
+        logger.warning("flask-sock not installed. WebSocket chat disabled. Install with: pip install flask-sock")
+        app.config["WEBSOCKET_ENABLED"] = False
+    
+    return app
+
+
+def __getattr__(name):
+    """Build the legacy module-level `app` on first access (e.g. `gunicorn App:app`)"""
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def setup_ngrok(auth_token: Optional[str] = None) -> Optional[str]:
@@ -416,6 +891,33 @@ DASHBOARD_HTML = """
             })
             .catch(() => statusDiv.classList.add('error'));
 
+        // Reuse one WebSocket for chat; fall back to POST when unavailable.
+        // The server answers in order, so unanswered queries are a FIFO queue.
+        let socket = null;
+        let pending = [];
+
+        function connectSocket() {
+            if (!('WebSocket' in window)) return;
+            const scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+            const ws = new WebSocket(scheme + location.host + '/ws/chat');
+            ws.onopen = () => { socket = ws; };
+            ws.onmessage = e => {
+                pending.shift();
+                showResult(JSON.parse(e.data));
+            };
+            ws.onclose = () => {
+                if (socket === ws) {
+                    socket = null;
+                    // Re-send anything the socket never answered over POST
+                    const unanswered = pending;
+                    pending = [];
+                    unanswered.forEach(postQuery);
+                    setTimeout(connectSocket, 3000);
+                }
+            };
+        }
+        connectSocket();
+
         function sendQuery() {
             const query = queryInput.value.trim();
             if (!query) return;
@@ -423,22 +925,34 @@ DASHBOARD_HTML = """
             addMessage('user', query);
             queryInput.value = '';
 
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                pending.push(query);
+                socket.send(JSON.stringify({ query }));
+                return;
+            }
+
+            postQuery(query);
+        }
+
+        function postQuery(query) {
             fetch('/api/diagnose', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ query })
             })
             .then(r => r.json())
-            .then(data => {
-                if (data.success) {
-                    addMessage('bot', data.response);
-                } else {
-                    addMessage('bot', '❌ Error: ' + (data.error || 'Unknown error'));
-                }
-            })
+            .then(showResult)
             .catch(e => addMessage('bot', '❌ Connection error'));
         }
 
+        function showResult(data) {
+            if (data.success) {
+                addMessage('bot', data.response);
+            } else {
+                addMessage('bot', '❌ Error: ' + (data.error || 'Unknown error'));
+            }
+        }
+
         function addMessage(role, text) {
             const msg = document.createElement('div');
             msg.className = 'message ' + role;
@@ -457,44 +971,150 @@ DASHBOARD_HTML = """
 
 
 # ================================================================================
-# API ENDPOINTS
+# HTTP RESPONSES
 # ================================================================================
 
-@app.route("/", methods=["GET"])
-def home():
-    """Home page with dashboard"""
-    return render_template_string(DASHBOARD_HTML)
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is installed"""
+    
+    def __init__(self, app):
+        super().__init__(app)
+        try:
+            import orjson
+            self._orjson = orjson
+        except ImportError:
+            self._orjson = None
+    
+    def dumps(self, obj, **kwargs) -> str:
+        if self._orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = 0
+        if kwargs.get("indent"):
+            option |= self._orjson.OPT_INDENT_2
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= self._orjson.OPT_SORT_KEYS
+        return self._orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def _load_brotli():
+    """Import brotli once, or None if not installed"""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
 
 
-@app.route("/api/health", methods=["GET"])
-def health():
-    """Health check endpoint"""
-    status = disease_model.get_status() if disease_model else {}
-    return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "model": status,
-        "ngrok_url": ngrok_url
-    }), 200
+def negotiate_encoding(available=("br", "gzip")) -> Optional[str]:
+    """Pick the best content encoding the client accepts"""
+    best, best_quality = None, 0
+    for encoding in available:
+        if encoding == "br" and _load_brotli() is None:
+            continue
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
 
 
-@app.route("/api/diagnose", methods=["POST"])
-def diagnose():
-    """Main diagnosis endpoint"""
-    try:
-        data = request.get_json() or {}
+def compress_body(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """Compress bytes; static assets use the slowest, smallest settings"""
+    if encoding == "br":
+        return _load_brotli().compress(data, quality=11 if static else 5)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+
+def compress_response(response: Response) -> Response:
+    """Compress large JSON bodies for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype != "application/json"):
+        return response
+    
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESS_MIN_BYTES"]:
+        return response
+    
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding:
+        response.set_data(compress_body(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class StaticAsset:
+    """Static response precomputed once with ETag and compressed variants"""
+    
+    def __init__(self, body: str, mimetype: str, max_age: int):
+        data = body.encode("utf-8")
+        self.mimetype = mimetype
+        self.max_age = max_age
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        self.variants = {None: data, "gzip": compress_body(data, "gzip", static=True)}
+        if _load_brotli() is not None:
+            self.variants["br"] = compress_body(data, "br", static=True)
+    
+    def response(self) -> Response:
+        """Serve the best variant, or 304 if the client copy is current"""
+        if request.if_none_match.contains_weak(self.etag):
+            response = Response(status=304)
+        else:
+            encoding = negotiate_encoding([e for e in ("br", "gzip") if e in self.variants])
+            response = Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
         
+        response.set_etag(self.etag, weak=True)
+        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+# ================================================================================
+# API ENDPOINTS
+# ================================================================================
+
+def process_diagnosis(data: Dict) -> tuple[Dict, int]:
+    """Run a diagnosis request end to end; shared by HTTP and WebSocket"""
+    services = get_services()
+    try:
         # Validate request
-        req = DiagnosisRequest(data.get("query", ""), data.get("session_id"))
-        valid, error_msg = req.is_valid()
+        req = DiagnosisRequest(data.get("query", ""), data.get("session_id"),
+                               data.get("priority", "normal"))
+        
+        config = current_app.config
+        valid, error_msg = req.is_valid(config["MIN_QUERY_LENGTH"], config["MAX_QUERY_LENGTH"])
+        
+        intent, canned = "diagnosis", None
+        if config["ENABLE_PREFILTER"] and req.query and len(req.query) <= config["MAX_QUERY_LENGTH"]:
+            intent, canned = services.prefilter.classify(req.query)
+        
+        # Short greetings/help ("hi") are answered despite MIN_QUERY_LENGTH
+        if not valid and intent not in QueryPreFilter.SHORT_INTENTS:
+            return {"success": False, "error": error_msg}, 400
+        
+        services.memory_monitor.check()
+        if services.memory_monitor.should_shed(req.priority):
+            return {"success": False, "error": "Server under memory pressure. Try again later."}, 503
         
-        if not valid:
-            return jsonify({"success": False, "error": error_msg}), 400
+        if config["ENABLE_PREFILTER"]:
+            services.prefilter.record(intent)
+        
+        # Answer canned intents without touching the model
+        if canned is not None:
+            response = DiagnosisResponse(True, req.query, response=canned,
+                                         session_id=req.session_id, intent=intent)
+            if config["ENABLE_HISTORY"] and intent != "off_topic":
+                services.conversation_history.add_message(req.session_id, "user", req.query)
+                services.conversation_history.add_message(req.session_id, "bot", canned)
+            return response.to_dict(), 200
         
         logger.info(f"[{req.session_id}] New request: {req.query[:50]}...")
         
         # Get diagnosis
-        result = disease_model.diagnose(req.query)
+        result = services.disease_model.diagnose(req.query)
         
         # Create response
         response = DiagnosisResponse(
@@ -506,35 +1126,95 @@ def diagnose():
         )
         
         # Save to history
-        if Config.ENABLE_HISTORY and result["success"]:
-            conversation_history.add_message(req.session_id, "user", req.query)
-            conversation_history.add_message(req.session_id, "bot", result["response"])
+        if config["ENABLE_HISTORY"] and result["success"]:
+            services.conversation_history.add_message(req.session_id, "user", req.query)
+            services.conversation_history.add_message(req.session_id, "bot", result["response"])
         
-        return jsonify(response.to_dict()), (200 if result["success"] else 400)
+        return response.to_dict(), (200 if result["success"] else 400)
         
     except Exception as e:
         logger.error(f"Endpoint error: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return {"success": False, "error": str(e)}, 500
+
+
+def chat_socket(ws):
+    """WebSocket chat channel: one JSON message in, one JSON response out"""
+    services = get_services()
+    session_id = str(uuid.uuid4())
+    while True:
+        raw = ws.receive()
+        if raw is None:
+            break
+        
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = {"query": raw}
+        if not isinstance(data, dict):
+            data = {"query": str(data)}
+        data.setdefault("session_id", session_id)
+        
+        services.metrics.increment("websocket.messages")
+        payload, status = process_diagnosis(data)
+        payload["status"] = status
+        ws.send(current_app.json.dumps(payload))
 
 
-@app.route("/api/history/<session_id>", methods=["GET"])
+@api.route("/", methods=["GET"])
+def home():
+    """Home page with dashboard"""
+    return current_app.extensions["dashboard"].response()
+
+
+@api.route("/api/health", methods=["GET"])
+def health():
+    """Health check endpoint"""
+    services = get_services()
+    status = services.disease_model.get_status() if services.disease_model else {}
+    memory_level = services.memory_monitor.check()
+    return jsonify({
+        "status": "healthy" if memory_level == "normal" else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "model": status,
+        "memory": services.memory_monitor.get_status(),
+        "prefilter": services.prefilter.get_status(),
+        "metrics": services.metrics.snapshot(),
+        "websocket": current_app.config.get("WEBSOCKET_ENABLED", False),
+        "ngrok_url": ngrok_url
+    }), 200
+
+
+@api.route("/api/diagnose", methods=["POST"])
+def diagnose():
+    """Main diagnosis endpoint"""
+    payload, status = process_diagnosis(request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+
+@api.route("/api/history/<session_id>", methods=["GET"])
 def get_history(session_id):
     """Get conversation history"""
-    if not Config.ENABLE_HISTORY:
+    services = get_services()
+    if not current_app.config["ENABLE_HISTORY"]:
         return jsonify({"error": "History disabled"}), 403
     
-    history = conversation_history.get_history(session_id)
+    services.memory_monitor.check()
+    if services.memory_monitor.should_shed("low"):
+        return jsonify({"error": "Server under memory pressure. Try again later."}), 503
+    
+    history = services.conversation_history.get_history(session_id)
     return jsonify({"session_id": session_id, "messages": history}), 200
 
 
-@app.route("/api/clear-history/<session_id>", methods=["POST"])
+@api.route("/api/clear-history/<session_id>", methods=["POST"])
 def clear_history(session_id):
     """Clear conversation history"""
-    conversation_history.clear_history(session_id)
+    services = get_services()
+    services.conversation_history.clear_history(session_id)
     return jsonify({"success": True, "message": "History cleared"}), 200
 
 
-@app.route("/api/info", methods=["GET"])
+@api.route("/api/info", methods=["GET"])
 def api_info():
     """API information"""
     return jsonify({
@@ -546,18 +1226,19 @@ def api_info():
             "POST /api/diagnose": "Get diagnosis",
             "GET /api/history/<session_id>": "Get chat history",
             "POST /api/clear-history/<session_id>": "Clear history",
-            "GET /api/info": "This endpoint"
+            "GET /api/info": "This endpoint",
+            "WS /ws/chat": "Chat over a persistent WebSocket"
         },
         "ngrok_url": ngrok_url
     }), 200
 
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Endpoint not found", "status": 404}), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def server_error(error):
     return jsonify({"error": "Internal server error", "status": 500}), 500
 
@@ -566,7 +1247,7 @@ def server_error(error):
 # CONSOLE INTERFACE
 # ================================================================================
 
-def run_console():
+def run_console(services: ChatbotServices):
     """Interactive console for testing"""
     print("\n" + "="*80)
     print("CROP DISEASE CHATBOT - CONSOLE INTERFACE")
@@ -607,7 +1288,7 @@ def run_console():
                 continue
             
             if user_input.lower() == "status":
-                status = disease_model.get_status()
+                status = services.disease_model.get_status()
                 print(f"\n📊 Model Status:")
                 for key, value in status.items():
                     print(f"  {key}: {value}")
@@ -615,7 +1296,7 @@ def run_console():
                 continue
             
             if user_input.lower() == "history":
-                hist = conversation_history.get_history(default_session)
+                hist = services.conversation_history.get_history(default_session)
                 if hist:
                     print("\n📜 Recent interactions:")
                     for msg in hist[-5:]:
@@ -626,7 +1307,7 @@ def run_console():
                 continue
             
             if user_input.lower() == "clear":
-                conversation_history.clear_history(default_session)
+                services.conversation_history.clear_history(default_session)
                 print("✓ History cleared\n")
                 continue
             
@@ -634,19 +1315,30 @@ def run_console():
             req = DiagnosisRequest(user_input, default_session)
             valid, error = req.is_valid()
             
-            if not valid:
+            intent, canned = "diagnosis", None
+            if Config.ENABLE_PREFILTER and len(req.query) <= Config.MAX_QUERY_LENGTH:
+                intent, canned = services.prefilter.classify(req.query)
+            
+            if not valid and intent not in QueryPreFilter.SHORT_INTENTS:
                 print(f"⚠️  {error}\n")
                 continue
             
+            if Config.ENABLE_PREFILTER:
+                services.prefilter.record(intent)
+            
+            if canned is not None:
+                print(f"\nBot: {canned}\n")
+                continue
+            
             print("🔄 Processing...", end="", flush=True)
-            result = disease_model.diagnose(user_input)
+            result = services.disease_model.diagnose(user_input)
             print("\r" + " "*30 + "\r", end="")
             
             if result["success"]:
                 print(f"\nBot: {result['response']}\n")
                 if Config.ENABLE_HISTORY:
-                    conversation_history.add_message(default_session, "user", user_input)
-                    conversation_history.add_message(default_session, "bot", result['response'])
+                    services.conversation_history.add_message(default_session, "user", user_input)
+                    services.conversation_history.add_message(default_session, "bot", result['response'])
             else:
                 print(f"\n❌ Error: {result['error']}\n")
         
@@ -663,7 +1355,8 @@ def run_console():
 # ================================================================================
 
 if __name__ == "__main__":
-    import sys
+    configure_logging()
+    services = ChatbotServices(Config)
     
     print("\n" + "="*80)
     print("CROP DISEASE CHATBOT - INITIALIZATION")
@@ -671,7 +1364,7 @@ if __name__ == "__main__":
     
     # Initialize model
     logger.info("Initializing model...")
-    if not init_model():
+    if not services.init_model():
         logger.error("Failed to initialize model!")
         sys.exit(1)
     
@@ -709,7 +1402,8 @@ if __name__ == "__main__":
         print(f"  GET  http://localhost:{Config.PORT}/api/health")
         print(f"  GET  http://localhost:{Config.PORT}/api/info\n")
         
+        app = create_app(Config, services)
         app.run(host=Config.HOST, port=Config.PORT, debug=Config.DEBUG)
     else:
         # Console mode (default)
-        run_console()
+        run_console(services)
@@ -0,0 +1,89 @@
+"""
+Import-Time Benchmark
+=====================
+Measures how long `import App` takes using `python -X importtime` and checks
+that heavy dependencies (torch, transformers) are not pulled in at import.
+
+Usage:
+    python bench_import.py                  # report, exit 1 if over budget
+    python bench_import.py --budget-ms 500  # custom budget
+    python bench_import.py --top 20         # show 20 slowest imports
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Budget for the cumulative import time of App, in milliseconds
+IMPORT_BUDGET_MS = 400
+
+# Modules that must only be imported once a model is actually needed
+LAZY_MODULES = ("torch", "transformers")
+
+
+def run_importtime(module: str = "App") -> str:
+    """Import a module in a fresh interpreter and return the -X importtime log"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return result.stderr
+
+
+def parse_importtime(log: str) -> Dict[str, Tuple[int, int]]:
+    """Parse importtime output into {module: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def slowest(timings: Dict[str, Tuple[int, int]], top: int) -> List[Tuple[str, int]]:
+    """Top-level packages ordered by cumulative import time"""
+    packages = {}
+    for name, (_, cumulative_us) in timings.items():
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), cumulative_us)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark App import time")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    timings = parse_importtime(run_importtime("App"))
+    total_ms = timings["App"][1] / 1000
+
+    print(f"import App: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("\nSlowest packages:")
+    for package, cumulative_us in slowest(timings, args.top):
+        print(f"  {package:<30} {cumulative_us / 1000:8.1f} ms")
+
+    failed = False
+    eager = [m for m in LAZY_MODULES if m in timings]
+    if eager:
+        print(f"\n❌ Heavy modules imported eagerly: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\n❌ Import time over budget by {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if not failed:
+        print("\n✓ Import time within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
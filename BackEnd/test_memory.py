@@ -0,0 +1,114 @@
+"""
+Memory Monitor Tests
+====================
+Checks MemoryMonitor level mapping, transitions and load shedding.
+
+Usage:
+    python -m pytest test_memory.py
+"""
+
+import pytest
+
+pytest.importorskip("flask")
+
+from App import Config, MemoryMonitor, ServiceMetrics
+
+
+class MemoryConfig(Config):
+    MEMORY_REDUCE_AT = 75.0
+    MEMORY_SHED_AT = 85.0
+    MEMORY_CRITICAL_AT = 92.0
+    MEMORY_RSS_LIMIT_MB = None
+    MEMORY_CLEAR_INTERVAL = 60.0
+
+
+class RssLimitConfig(MemoryConfig):
+    MEMORY_RSS_LIMIT_MB = 1000
+
+
+def make_monitor(samples, config=MemoryConfig):
+    """Monitor whose sample() returns the given used_percent values in turn"""
+    monitor = MemoryMonitor(ServiceMetrics(), config)
+    values = iter(samples)
+    monitor.sample = lambda: {"rss_mb": 100.0, "used_percent": next(values)}
+    return monitor
+
+
+@pytest.mark.parametrize("sample,config,level", [
+    ({}, MemoryConfig, "normal"),
+    ({"used_percent": 50.0}, MemoryConfig, "normal"),
+    ({"used_percent": 75.0}, MemoryConfig, "reduced"),
+    ({"used_percent": 84.9}, MemoryConfig, "reduced"),
+    ({"used_percent": 85.0}, MemoryConfig, "shedding"),
+    ({"used_percent": 92.0}, MemoryConfig, "critical"),
+    ({"used_percent": 99.0}, MemoryConfig, "critical"),
+    # RSS limit raises the level even when the host has memory to spare
+    ({"used_percent": 10.0, "rss_mb": 800.0}, RssLimitConfig, "reduced"),
+    ({"used_percent": 10.0, "rss_mb": 950.0}, RssLimitConfig, "critical"),
+    ({"used_percent": 10.0, "rss_mb": 950.0}, MemoryConfig, "normal"),
+])
+def test_level_for(sample, config, level):
+    assert MemoryMonitor(config=config)._level_for(sample) == level
+
+
+def test_transitions_are_recorded():
+    monitor = make_monitor([50.0, 80.0, 80.0, 90.0, 95.0, 50.0])
+    levels = [monitor.check(force=True) for _ in range(6)]
+    assert levels == ["normal", "reduced", "reduced", "shedding", "critical", "normal"]
+
+    snapshot = monitor.metrics.snapshot()
+    assert snapshot["counters"]["memory.transition.reduced"] == 1
+    assert snapshot["counters"]["memory.transition.critical"] == 1
+    assert snapshot["counters"]["memory.transition.normal"] == 1
+    transitions = [(e["from_level"], e["to_level"]) for e in snapshot["events"]]
+    assert transitions == [("normal", "reduced"), ("reduced", "shedding"),
+                           ("shedding", "critical"), ("critical", "normal")]
+
+
+def test_caches_cleared_on_entering_critical_then_rate_limited():
+    cleared = []
+    monitor = make_monitor([95.0, 95.0, 95.0])
+    monitor.register_cache(lambda: cleared.append(True))
+
+    monitor.check(force=True)
+    assert len(cleared) == 1
+
+    # Still critical within MEMORY_CLEAR_INTERVAL: no second clear
+    monitor.check(force=True)
+    assert len(cleared) == 1
+
+    monitor._last_clear -= MemoryConfig.MEMORY_CLEAR_INTERVAL
+    monitor.check(force=True)
+    assert len(cleared) == 2
+
+
+def test_check_is_rate_limited():
+    monitor = make_monitor([95.0])
+    assert monitor.check(force=True) == "critical"
+    # A second sample would raise StopIteration; the cached level is returned
+    assert monitor.check() == "critical"
+
+
+@pytest.mark.parametrize("level,priority,shed", [
+    ("normal", "low", False),
+    ("reduced", "low", False),
+    ("shedding", "low", True),
+    ("shedding", "normal", False),
+    ("critical", "low", True),
+    ("critical", "normal", True),
+    ("critical", "high", False),
+])
+def test_should_shed(level, priority, shed):
+    monitor = MemoryMonitor(config=MemoryConfig)
+    monitor.level = level
+    assert monitor.should_shed(priority) is shed
+
+
+def test_budgets_shrink_with_level():
+    monitor = MemoryMonitor(config=MemoryConfig)
+    assert monitor.token_budget(256) == 256
+    monitor.level = "reduced"
+    assert monitor.token_budget(256) == 128
+    assert monitor.input_budget(2048) == 1024
+    monitor.level = "critical"
+    assert monitor.token_budget(256) == 64
@@ -0,0 +1,83 @@
+"""
+Query Pre-Filter Tests
+======================
+Table-driven checks for QueryPreFilter.classify.
+
+Usage:
+    python -m pytest test_prefilter.py
+"""
+
+import pytest
+
+pytest.importorskip("flask")
+
+from App import QueryPreFilter
+
+
+CASES = [
+    # Greetings and help
+    ("hi", "greeting"),
+    ("Hello there!", "greeting"),
+    ("thanks", "greeting"),
+    ("help", "help"),
+    ("what can you do?", "help"),
+
+    # Spam
+    ("buy cheap watches at www.example.com", "off_topic"),
+    ("buy cheap watches now", "off_topic"),
+    ("check out https://example.org now", "off_topic"),
+    ("", "off_topic"),
+
+    # Non-farming questions
+    ("What is the capital of France?", "off_topic"),
+    ("who won the football game yesterday", "off_topic"),
+    ("write me a poem about the sea", "off_topic"),
+
+    # Diagnosis questions, including ones without an obvious keyword
+    ("My apple tree has velvety olive-green spots", "diagnosis"),
+    ("How to treat powdery mildew on grapes?", "diagnosis"),
+    ("Rice plants showing yellow patches - what disease?", "diagnosis"),
+    ("How do I get rid of whiteflies?", "diagnosis"),
+    ("Why is my orchard dying?", "diagnosis"),
+    ("Which chemical controls thrips on my greenhouse?", "diagnosis"),
+    ("Nematodes galls found, what to do", "diagnosis"),
+    ("Black sooty coating all over", "diagnosis"),
+    ("thanks, my tomatoes are fine now", "diagnosis"),
+    ("see https://imgur.com/a.jpg tomato leaf spots", "diagnosis"),
+    ("photo at www.example.com of brown lesions on leaves", "diagnosis"),
+    ("Caterpillars chewed holes everywhere", "diagnosis"),
+    ("anthracnose", "diagnosis"),
+    ("Fusarium?", "diagnosis"),
+
+    # Colour and farm-input words are not unsupported crops
+    ("Velvety olive-green spots on leaves", "diagnosis"),
+    ("Should I add lime to acidic soil?", "diagnosis"),
+    ("Can I use lime sulfur for scab on my pears?", "diagnosis"),
+
+    # Plurals of supported crops
+    ("peaches have fuzzy gray growth", "diagnosis"),
+    ("potatoes turning black inside", "diagnosis"),
+    ("strawberries covered in gray fuzz", "diagnosis"),
+
+    # Unsupported crops with no other farming context
+    ("what about my coffee?", "unsupported_crop"),
+    ("do you know bananas", "unsupported_crop"),
+]
+
+
+@pytest.mark.parametrize("query,intent", CASES)
+def test_classify(query, intent):
+    assert QueryPreFilter().classify(query)[0] == intent
+
+
+@pytest.mark.parametrize("word,singular", [
+    ("peaches", "peach"),
+    ("tomatoes", "tomato"),
+    ("cherries", "cherry"),
+    ("radishes", "radish"),
+    ("boxes", "box"),
+    ("grapes", "grape"),
+    ("grass", "grass"),
+])
+def test_singular(word, singular):
+    assert QueryPreFilter._singular(word) == singular